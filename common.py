@@ -1,9 +1,13 @@
 import re
 from collections import defaultdict
-from typing import Iterator
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator
 import io
 import json
 import os
+import queue
+import tempfile
+import threading
 
 import requests
 from bs4 import BeautifulSoup
@@ -15,11 +19,13 @@ from settings import *
 
 
 FMT_REGEX = re.compile(r'\s*(\\.(?:\[[^\]]+\])?)\s*')
+UNESCAPED_QUOTE_REGEX = re.compile(r'(?<!\\)"')
 REPLACE_REGEX = re.compile(r'\s*\\\s*k\s*\[\s*\d+\s*\]\s*')
 NAME_REGEX = re.compile(r'\\>\\i\[(\d+)\]\\\}([^\\]+)\\\{\\<')
 ASCII_REGEX = re.compile(r'[A-Za-z]')
 MENU_CATEGORY_REGEX = re.compile(r'<Menu Category:([^>]+)>')
 COMMENT_REGEX = re.compile(r'\[[a-z]+\]')
+SENTENCE_REGEX = re.compile(r'(?<=[^\\][.!?])\s+')
 
 
 def iterate_over_dict(data: dict | list) -> Iterator[dict]:
@@ -65,6 +71,22 @@ def collapse(data: Iterator[dict]) -> Iterator[dict]:
         yield obj
 
 
+def collapse_data(data: dict | list) -> list[dict]:
+    """collapses 401 lines in place, returns all objects of data"""
+    return list(collapse(iterate_over_dict(data)))
+
+
+def split_sentences(text: str) -> tuple[str, list[str]]:
+    """splits a 401 message block into the name line and sentences"""
+    lines = text.split('\n')
+    head = ''
+    if lines[0].startswith('\\>'):
+        head = lines.pop(0)
+    body = ' '.join(line.strip() for line in lines).strip()
+    sentences = SENTENCE_REGEX.split(body) if body else []
+    return head, sentences
+
+
 def except_gab_text(f):
     def wrap(text: str, *args, **kwargs) -> str:
         if text.startswith('GabText '):
@@ -223,6 +245,11 @@ class Font:
         return self.get_width(clean_text)
 
 
+@lru_cache(maxsize=None)
+def load_font(font_path: str) -> Font:
+    return Font(font_path)
+
+
 def get_authenticated_service():
     google_service_account = os.environ.get('GOOGLE_SERVICE_ACCOUNT')
     if google_service_account:
@@ -274,3 +301,165 @@ def upload_file(service, file_id: str, body: str):
         media_body=m,
         media_mime_type='text/plain',
     ).execute()
+
+
+def unescape_doc_text(text: str) -> str:
+    """the doc keeps strings json-escaped, see print_translate_cache.py"""
+    try:
+        return json.loads(f'"{text}"')
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads('"' + UNESCAPED_QUOTE_REGEX.sub(r'\\"', text) + '"')
+    except json.JSONDecodeError:
+        return text
+
+
+def load_json(path: str, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def get_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# os.umask() changes the mask of the whole process, so it is read once
+# on import instead of from the writer threads
+UMASK = get_umask()
+
+
+def write_atomic(path: str, body: str):
+    """writes to a temp file and renames it, so the file is never partial"""
+    dir_name = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~UMASK
+    fd, tmp_path = tempfile.mkstemp(
+        dir=dir_name, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        # the file object closes fd if anything below fails
+        with os.fdopen(fd, 'w') as f:
+            # mkstemp creates the file as 0600
+            os.chmod(tmp_path, mode)
+            f.write(body)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def save_json_atomic(path: str, data, **kwargs):
+    write_atomic(path, json.dumps(data, **kwargs))
+
+
+def prefetch(f: Callable, items: Iterable, depth: int) -> Iterator[tuple]:
+    """
+    Yields (item, f(item)) computing f in a background thread,
+    at most depth results ahead of the consumer.
+    """
+    results = queue.Queue(depth)
+
+    def work():
+        for item in items:
+            try:
+                result = f(item)
+            except BaseException as e:
+                results.put((item, None, e))
+                return
+            results.put((item, result, None))
+        results.put(None)
+
+    threading.Thread(target=work, daemon=True).start()
+    while (entry := results.get()) is not None:
+        item, result, error = entry
+        if error is not None:
+            raise error
+        yield item, result
+
+
+class BackgroundWorker:
+    """
+    Runs submitted calls one by one in a background thread.
+    submit() blocks while maxsize calls are pending, on exit
+    the pending calls are finished and the first error is raised.
+    """
+
+    def __init__(self, maxsize: int):
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def work(self):
+        while (entry := self.queue.get()) is not None:
+            f, args = entry
+            try:
+                f(*args)
+            except BaseException as e:
+                if self.error is None:
+                    self.error = e
+
+    def submit(self, f: Callable, *args):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((f, args))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.queue.put(None)
+        self.thread.join()
+        if exc is None and self.error is not None:
+            raise self.error
+
+
+def merge_translations(
+        base: dict[str, str],
+        local: dict[str, str],
+        remote: Iterable[tuple[str, str]],
+) -> tuple[dict, dict, dict, dict]:
+    """
+    Three-way merge of the doc (remote) into the local cache.
+
+    base is the doc state of the previous sync. Returns the merged cache,
+    the new base, the keys changed against the local cache (None means
+    deleted) and the conflicts as key -> (base, local, remote).
+    On conflict the doc wins, except for keys deleted from the doc
+    but edited locally, those are kept.
+    """
+    merged = {}
+    new_base = {}
+    changed = {}
+    conflicts = {}
+    for key, theirs in remote:
+        new_base[key] = theirs
+        ours = local.get(key)
+        ancestor = base.get(key)
+        if ours is None or ours == theirs or ours == ancestor:
+            value = theirs
+        elif theirs == ancestor:
+            value = ours
+        else:
+            value = theirs
+            conflicts[key] = ancestor, ours, theirs
+        merged[key] = value
+        if value != ours:
+            changed[key] = value
+    for key, ours in local.items():
+        if key in new_base:
+            continue
+        if key not in base:
+            merged[key] = ours
+        elif base[key] == ours:
+            changed[key] = None
+        else:
+            merged[key] = ours
+            conflicts[key] = base[key], ours, None
+    return merged, new_base, changed, conflicts
@@ -0,0 +1,122 @@
+import sqlite3
+import statistics
+import sys
+import time
+
+from settings import RUN_HISTORY_FILENAME
+
+METRICS = (
+    'duration',
+    'peak_memory',
+    'files',
+    'strings',
+    'cache_hits',
+    'api_calls',
+    'translator_time',
+    'overspaces',
+    'bad_translate',
+    'bad_formatting',
+)
+# metric -> absolute growth which is never reported, to ignore noise
+REGRESSION_METRICS = {
+    'duration': 5.0,
+    'peak_memory': 50 * 1024 * 1024,
+    'api_calls': 10,
+}
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    {', '.join(f'{m} REAL NOT NULL DEFAULT 0' for m in METRICS)}
+);
+CREATE TABLE IF NOT EXISTS file_timings (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    filename TEXT NOT NULL,
+    duration REAL NOT NULL
+);
+'''
+
+
+def get_peak_memory() -> int:
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak *= 1024  # kilobytes on linux
+    return peak
+
+
+class RunHistory:
+
+    def __init__(self, path: str = RUN_HISTORY_FILENAME):
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def append(
+            self,
+            record: dict,
+            file_timings: dict[str, float],
+            status: str = 'ok',
+            started_at: float | None = None,
+    ) -> int:
+        with self.conn:
+            cur = self.conn.execute(
+                f'INSERT INTO runs (started_at, status, {", ".join(METRICS)})'
+                f' VALUES (?, ?, {", ".join("?" * len(METRICS))})',
+                (
+                    time.time() if started_at is None else started_at,
+                    status,
+                    *(record.get(m, 0) for m in METRICS),
+                ),
+            )
+            run_id = cur.lastrowid
+            self.conn.executemany(
+                'INSERT INTO file_timings (run_id, filename, duration)'
+                ' VALUES (?, ?, ?)',
+                [(run_id, fn, d) for fn, d in file_timings.items()],
+            )
+        return run_id
+
+    def last_runs(self, count: int, status: str = 'ok') -> list[dict]:
+        rows = self.conn.execute(
+            'SELECT * FROM runs WHERE status = ? ORDER BY id DESC LIMIT ?',
+            (status, count),
+        )
+        return [dict(row) for row in rows]
+
+    def slowest_files(self, run_id: int, count: int) -> list[tuple[str, float]]:
+        rows = self.conn.execute(
+            'SELECT filename, duration FROM file_timings WHERE run_id = ?'
+            ' ORDER BY duration DESC LIMIT ?',
+            (run_id, count),
+        )
+        return [tuple(row) for row in rows]
+
+
+def get_baseline(runs: list[dict]) -> dict[str, float]:
+    return {
+        m: statistics.median(run[m] for run in runs)
+        for m in METRICS
+    }
+
+
+def find_regressions(
+        latest: dict,
+        baseline: dict[str, float],
+        threshold: float,
+) -> list[tuple[str, float, float]]:
+    regressions = []
+    for metric, min_delta in REGRESSION_METRICS.items():
+        value = latest[metric]
+        expected = baseline[metric]
+        if value > expected * threshold and value - expected > min_delta:
+            regressions.append((metric, value, expected))
+    return regressions
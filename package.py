@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import zipfile
+from multiprocessing.pool import ThreadPool
+from os.path import join
+
+from common import load_json, save_json_atomic
+
+ARCHIVE_NAME = 'fear-and-hunger-2-ru'
+MANIFEST_FILENAME = 'manifest.json'
+PATCH_MANIFEST_FILENAME = 'patch.json'
+# already compressed, deflate only wastes time on them
+STORED_EXTENSIONS = {
+    '.rpgmvp', '.rpgmvo', '.rpgmvm', '.png', '.ogg', '.m4a', '.webm', '.mp4',
+}
+
+
+def fetch_files(game_dir: str) -> list[str]:
+    files = []
+    for root, _dirs, filenames in os.walk(game_dir):
+        for filename in filenames:
+            path = os.path.relpath(join(root, filename), game_dir)
+            files.append(path.replace(os.sep, '/'))
+    files.sort()
+    return files
+
+
+def hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def build_manifest(game_dir: str, files: list[str], pool: ThreadPool) -> dict:
+    hashes = pool.map(hash_file, [join(game_dir, fn) for fn in files])
+    return {'files': dict(zip(files, hashes))}
+
+
+def diff_manifests(previous: dict, current: dict) -> tuple[list[str], list[str]]:
+    prev_files = previous['files']
+    cur_files = current['files']
+    changed = [fn for fn, h in cur_files.items() if prev_files.get(fn) != h]
+    removed = [fn for fn in prev_files if fn not in cur_files]
+    return changed, removed
+
+
+def hash_manifest(manifest: dict) -> str:
+    body = json.dumps(manifest, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(body).hexdigest()
+
+
+def write_zip(path: str, game_dir: str, files: list[str], extra: dict | None = None):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for fn in files:
+            ext = os.path.splitext(fn)[1].lower()
+            z.write(
+                join(game_dir, fn),
+                fn,
+                zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else None,
+            )
+        for fn, data in (extra or {}).items():
+            z.writestr(fn, json.dumps(data, ensure_ascii=False, indent=2))
+
+
+def main(game_dir: str, previous_manifest_path: str | None, output_dir: str):
+    full_path = join(output_dir, f'{ARCHIVE_NAME}.zip')
+    patch_path = join(output_dir, f'{ARCHIVE_NAME}-patch.zip')
+    files = fetch_files(game_dir)
+    with ThreadPool() as pool:
+        manifest = build_manifest(game_dir, files, pool)
+        jobs = [pool.apply_async(write_zip, (full_path, game_dir, files))]
+
+        previous = None
+        if previous_manifest_path:
+            previous = load_json(previous_manifest_path)
+        if not previous:
+            print('no previous manifest, the patch contains all files')
+        changed, removed = diff_manifests(previous or {'files': {}}, manifest)
+        patch = {
+            'base': hash_manifest(previous) if previous else None,
+            'target': hash_manifest(manifest),
+            'changed': changed,
+            'removed': removed,
+        }
+        jobs.append(pool.apply_async(
+            write_zip,
+            (patch_path, game_dir, changed, {PATCH_MANIFEST_FILENAME: patch}),
+        ))
+        print(f'patch: {len(changed)} changed, {len(removed)} removed')
+
+        for job in jobs:
+            job.get()
+    save_json_atomic(join(output_dir, MANIFEST_FILENAME), manifest, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--game-dir',
+        help='location of the translated game directory',
+        required=True,
+    )
+    parser.add_argument(
+        '--previous-manifest',
+        help='manifest of the previous release to build the patch against',
+    )
+    parser.add_argument(
+        '--output-dir',
+        default='.',
+    )
+    args = parser.parse_args()
+    main(args.game_dir, args.previous_manifest, args.output_dir)
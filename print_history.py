@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import sys
+
+from history import METRICS, RunHistory, find_regressions, get_baseline
+from settings import RUN_HISTORY_FILENAME
+
+
+def main(path: str, baseline_size: int, threshold: float) -> bool:
+    history = RunHistory(path)
+    runs = history.last_runs(baseline_size + 1)
+    if not runs:
+        print('no runs in', path)
+        return True
+    latest, previous = runs[0], runs[1:]
+    started_at = datetime.datetime.fromtimestamp(latest['started_at'])
+    print(f'=== Run #{latest["id"]} at {started_at:%Y-%m-%d %H:%M:%S}')
+    baseline = get_baseline(previous) if previous else None
+    for metric in METRICS:
+        line = f'{metric:>16}: {latest[metric]:.2f}'
+        if baseline:
+            line += f' (baseline {baseline[metric]:.2f})'
+        print(line)
+    print()
+    print('=== Slowest files:')
+    for filename, duration in history.slowest_files(latest['id'], 5):
+        print(f'{duration:8.2f}s {filename}')
+    history.close()
+
+    if not baseline:
+        return True
+    regressions = find_regressions(latest, baseline, threshold)
+    if regressions:
+        print()
+        print(f'=== Regressions against the last {len(previous)} runs:')
+        for metric, value, expected in regressions:
+            line = f'{metric}: {value:.2f} > {expected:.2f}'
+            if expected:
+                line += f' ({value / expected:.1f}x)'
+            print(line)
+    return not regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--history',
+        default=RUN_HISTORY_FILENAME,
+    )
+    parser.add_argument(
+        '--baseline',
+        help='the number of previous runs for the rolling baseline',
+        type=int,
+        default=10,
+    )
+    parser.add_argument(
+        '--threshold',
+        help='report a metric which grew more than this ratio',
+        type=float,
+        default=1.5,
+    )
+    parser.add_argument(
+        '--fail',
+        help='exit with an error code when there are regressions',
+        action='store_true',
+    )
+    args = parser.parse_args()
+    ok = main(args.history, args.baseline, args.threshold)
+    if args.fail and not ok:
+        sys.exit(1)
@@ -1,38 +1,202 @@
 #!/usr/bin/env python3
 import argparse
+import difflib
 import json
+import os
 import re
+import zlib
+from multiprocessing import Pool
+from os.path import join
+
+from common import load_json, save_json_atomic
+from settings import PROGRESS_SNAPSHOT_FILENAME
 
 LETTERS_REGEX = re.compile(r'[А-я]')
+MAP_REGEX = re.compile(r'Map(\d+)\.json')
+DISTANCE_CHUNK_SIZE = 256
+
+
+def main(
+        original: str,
+        target: str,
+        snapshot_path: str,
+        game_dir: str | None,
+        weighted: bool,
+        as_json: bool,
+) -> None:
+    snapshot = load_json(snapshot_path, {})
+    original_stat = get_stat(original)
+    original_data = None
+    if snapshot.get('original', {}).get('stat') == original_stat:
+        original_fps = snapshot['original']['letters']
+    else:
+        original_data = load_json(original)
+        original_fps = {k: fingerprint(only_letters(v)) for k, v in original_data.items()}
+    target_data = load_json(target)
 
+    # key -> [crc of the target value, fingerprint of the original, edited, distance]
+    prev_entries = snapshot.get('target', {})
+    entries = {}
+    for k, t in target_data.items():
+        of = original_fps.get(k)
+        if of is None:
+            continue
+        raw = zlib.crc32(t.encode('utf-8'))
+        entry = prev_entries.get(k)
+        if entry is None or entry[0] != raw or entry[1] != of:
+            edited = fingerprint(only_letters(t)) != of
+            entry = [raw, of, edited, None if edited else 0.0]
+        entries[k] = entry
 
-def main(original: str, target: str) -> None:
-    with open(original) as f:
-        original_data = dict(sorted(json.loads(f.read()).items()))
-    with open(target) as f:
-        target_data = dict(sorted(json.loads(f.read()).items()))
+    if weighted:
+        pending = [k for k, entry in entries.items() if entry[3] is None]
+        if pending:
+            if original_data is None:
+                original_data = load_json(original)
+            distances = get_distances(
+                [(original_data[k], target_data[k]) for k in pending])
+            for k, d in zip(pending, distances):
+                entries[k][3] = d
 
-    for k in set(original_data) - set(target_data):
-        del original_data[k]
-    for k in set(target_data) - set(original_data):
-        del target_data[k]
+    edited = sum(1 for entry in entries.values() if entry[2])
+    total = len(entries)
+    result = {
+        'edited': edited,
+        'untouched': total - edited,
+        'missing': len(original_fps) - total,
+        'percent': 100 * edited / total if total else 0.0,
+    }
+    if weighted:
+        result['weighted_percent'] = (
+            100 * sum(entry[3] for entry in entries.values()) / total
+            if total else 0.0
+        )
 
-    assert original_data.keys() == target_data.keys()
+    files = snapshot.get('files', {})
+    files_keys = snapshot.get('files_keys')
+    if game_dir:
+        keys = set(original_fps)
+        keys_fp = fingerprint('\0'.join(sorted(keys)))
+        if keys_fp != files_keys:
+            # cached keys of the files were collected for another key set
+            files = {}
+            files_keys = keys_fp
+        files = get_file_keys(game_dir, keys, files)
+        result['files'] = {}
+        for filename, info in files.items():
+            keys = [k for k in info['keys'] if k in entries]
+            result['files'][filename] = {
+                'name': info.get('name'),
+                'edited': sum(1 for k in keys if entries[k][2]),
+                'total': len(keys),
+            }
 
-    different_lines = 0
-    for o, t in zip(original_data.values(), target_data.values()):
-        o = only_letters(o)
-        t = only_letters(t)
-        if o != t:
-            different_lines += 1
+    save_json_atomic(snapshot_path, {
+        'original': {'stat': original_stat, 'letters': original_fps},
+        'target': entries,
+        'files': files,
+        'files_keys': files_keys,
+    }, ensure_ascii=False)
 
-    print('Отредактировано {:0.2f}% строк машинного перевода'.format(100 * different_lines / len(original_data)))
+    if as_json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    print('Отредактировано {:0.2f}% строк машинного перевода'.format(result['percent']))
+    print('Отредактировано: {edited}, не тронуто: {untouched}, нет в переводе: {missing}'.format(**result))
+    if weighted:
+        print('С учётом объёма правок: {:0.2f}%'.format(result['weighted_percent']))
+    for filename, info in result.get('files', {}).items():
+        if not info['total']:
+            continue
+        name = f' ({info["name"]})' if info['name'] else ''
+        print('{:>6.2f}% {}/{} {}{}'.format(
+            100 * info['edited'] / info['total'],
+            info['edited'],
+            info['total'],
+            filename,
+            name,
+        ))
 
 
 def only_letters(text: str) -> str:
     return ''.join(LETTERS_REGEX.findall(text))
 
 
+def fingerprint(text: str) -> int:
+    return zlib.crc32(text.encode('utf-8'))
+
+
+def get_stat(path: str) -> list:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def get_distance(pair: tuple[str, str]) -> float:
+    o, t = pair
+    return 1 - difflib.SequenceMatcher(
+        None, only_letters(o), only_letters(t), autojunk=False).ratio()
+
+
+def get_distances(pairs: list[tuple[str, str]]) -> list[float]:
+    if len(pairs) < DISTANCE_CHUNK_SIZE:
+        return [get_distance(pair) for pair in pairs]
+    with Pool() as pool:
+        return pool.map(get_distance, pairs, chunksize=DISTANCE_CHUNK_SIZE)
+
+
+def collect_keys(data, keys: set[str]) -> set[str]:
+    """
+    Strings of data which are keys of the translate cache,
+    401 lines are joined the same way as collapse does it.
+    """
+    found = set()
+    stack = [data]
+    while stack:
+        v = stack.pop()
+        if type(v) is str:
+            if v in keys:
+                found.add(v)
+        elif type(v) is list:
+            stack.extend(v)
+        elif type(v) is dict:
+            items = v.get('list')
+            if type(items) is list:
+                sentence = []
+                for item in items:
+                    if type(item) is dict and item.get('code') == 401:
+                        sentence.append(item['parameters'][0])
+                    elif sentence:
+                        found.add('\n'.join(sentence))
+                        sentence = []
+            stack.extend(v.values())
+    return found & keys
+
+
+def get_file_keys(game_dir: str, keys: set[str], prev_files: dict) -> dict:
+    """keys of the translate cache used by every file of the game"""
+    data_dir = join(game_dir, 'www/data')
+    map_names = {}
+    for info in load_json(join(data_dir, 'MapInfos.json'), []):
+        if info:
+            map_names[info['id']] = info['name']
+    files = {}
+    for filename in sorted(os.listdir(data_dir)):
+        if os.path.splitext(filename)[1].lower() != '.json':
+            continue
+        stat = get_stat(join(data_dir, filename))
+        info = prev_files.get(filename)
+        if info is None or info['stat'] != stat:
+            data = load_json(join(data_dir, filename))
+            info = {
+                'stat': stat,
+                'keys': sorted(collect_keys(data, keys)),
+            }
+        m = MAP_REGEX.fullmatch(filename)
+        info['name'] = map_names.get(int(m.group(1))) if m else None
+        files[filename] = info
+    return files
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -43,5 +207,30 @@ if __name__ == '__main__':
         '--target',
         required=True,
     )
+    parser.add_argument(
+        '--snapshot',
+        help='fingerprints of the previous run, only changed strings are compared',
+        default=PROGRESS_SNAPSHOT_FILENAME,
+    )
+    parser.add_argument(
+        '--game-dir',
+        help='location of the untranslated game, for the breakdown by files and maps',
+    )
+    parser.add_argument(
+        '--weighted',
+        help='weight edited strings by their edit distance',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--json',
+        action='store_true',
+    )
     args = parser.parse_args()
-    main(args.original, args.target)
+    main(
+        args.original,
+        args.target,
+        args.snapshot,
+        args.game_dir,
+        args.weighted,
+        args.json,
+    )
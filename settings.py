@@ -1,4 +1,16 @@
 TRANSLATE_CACHE_FILENAME = 'translate_cache.json'
+TRANSLATE_CACHE_BASE_FILENAME = 'translate_cache.base.json'
+RUN_HISTORY_FILENAME = 'run_history.sqlite3'
+PROGRESS_SNAPSHOT_FILENAME = 'progress_snapshot.json'
+
+SOURCE_LANGUAGE = 'en'
+TARGET_LANGUAGE = 'ru'
+DEFAULT_FONT = 'www/fonts/Garamond-Premier-Pro_19595.ttf'
+# files read ahead and waiting to be written
+PIPELINE_DEPTH = 2
+TRANSLATOR_THREADS = 10
+# save the translate cache every n translated strings of a budgeted run
+CHECKPOINT_EVERY = 50
 
 SERVICE_ACCOUNT_FILE = 'service.json'
 
@@ -0,0 +1,166 @@
+import threading
+from array import array
+from typing import Iterator
+
+
+class TranslateStore:
+    """
+    Translate map and usage counters over interned keys.
+
+    Every original string is stored once and referred to by its id,
+    the strings of the game are not kept alive after counting them.
+    Translations are a list and counters an array indexed by id.
+    snapshot() returns a compact picklable state which can be merged
+    into another store, e.g. from a worker process.
+    """
+
+    def __init__(self, data: dict[str, str] | None = None):
+        self.ids = {}
+        self.keys_by_id = []
+        self.values = []  # id -> translation or None
+        self.counters = array('i')
+        self.seen = array('i')  # ids in order of first use
+        self.order = None  # ids in the order set by resort()
+        self.size = 0
+        self.lock = threading.Lock()
+        if data:
+            self.update(data)
+
+    def add_key(self, key: str) -> int:
+        """must be called under self.lock"""
+        i = self.ids.get(key)
+        if i is None:
+            i = len(self.keys_by_id)
+            self.keys_by_id.append(key)
+            self.values.append(None)
+            self.counters.append(0)
+            self.ids[key] = i
+            if self.order is not None:
+                self.order.append(i)
+        return i
+
+    def intern(self, key: str) -> int:
+        i = self.ids.get(key)
+        if i is not None:
+            return i
+        with self.lock:
+            return self.add_key(key)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, key: str) -> bool:
+        i = self.ids.get(key)
+        return i is not None and self.values[i] is not None
+
+    def __getitem__(self, key: str) -> str:
+        i = self.ids.get(key)
+        if i is None or self.values[i] is None:
+            raise KeyError(key)
+        return self.values[i]
+
+    def get(self, key: str, default=None):
+        i = self.ids.get(key)
+        if i is None or self.values[i] is None:
+            return default
+        return self.values[i]
+
+    def __setitem__(self, key: str, value: str):
+        with self.lock:
+            self.set_value(self.add_key(key), value)
+
+    def set_value(self, i: int, value: str):
+        """must be called under self.lock"""
+        if self.values[i] is None:
+            self.size += 1
+        self.values[i] = value
+
+    def __delitem__(self, key: str):
+        with self.lock:
+            i = self.ids.get(key)
+            if i is None or self.values[i] is None:
+                raise KeyError(key)
+            self.values[i] = None
+            self.size -= 1
+
+    def __iter__(self) -> Iterator[str]:
+        for key, _value in self.items():
+            yield key
+
+    def keys(self) -> Iterator[str]:
+        return iter(self)
+
+    def items(self) -> Iterator[tuple[str, str]]:
+        if self.order is None:
+            pairs = zip(self.keys_by_id, self.values)
+        else:
+            pairs = ((self.keys_by_id[i], self.values[i]) for i in self.order)
+        for key, value in pairs:
+            if value is not None:
+                yield key, value
+
+    def update(self, data: dict[str, str]):
+        with self.lock:
+            for k, v in data.items():
+                self.set_value(self.add_key(k), v)
+
+    def to_dict(self) -> dict[str, str]:
+        return dict(self.items())
+
+    def count(self, key: str) -> int:
+        with self.lock:
+            i = self.add_key(key)
+            if not self.counters[i]:
+                self.seen.append(i)
+            self.counters[i] += 1
+        return i
+
+    def get_count(self, key: str) -> int:
+        i = self.ids.get(key)
+        return 0 if i is None else self.counters[i]
+
+    def counted(self) -> Iterator[str]:
+        """keys in order of first use"""
+        for i in self.seen:
+            yield self.keys_by_id[i]
+
+    def uncounted(self) -> list[str]:
+        return [
+            key
+            for key, value, counter in zip(
+                self.keys_by_id, self.values, self.counters)
+            if value is not None and not counter
+        ]
+
+    def resort(self):
+        """keeps only used keys in order of first use, ids do not change"""
+        with self.lock:
+            seen = set(self.seen)
+            for i, value in enumerate(self.values):
+                if value is not None and i not in seen:
+                    self.values[i] = None
+                    self.size -= 1
+            self.order = array('i', self.seen)
+
+    def snapshot(self) -> tuple:
+        return (
+            self.keys_by_id,
+            self.values,
+            self.counters.tobytes(),
+            self.seen.tobytes(),
+        )
+
+    def merge(self, snapshot: tuple):
+        """merges the snapshot of another store, its translations win"""
+        keys, values, counters, seen = snapshot
+        counters = array('i', counters)
+        with self.lock:
+            remap = array('i', (self.add_key(key) for key in keys))
+            for i, value in enumerate(values):
+                if value is not None:
+                    self.set_value(remap[i], value)
+            for i in array('i', seen):
+                j = remap[i]
+                if not self.counters[j]:
+                    self.seen.append(j)
+                self.counters[j] += counters[i]
@@ -1,8 +1,11 @@
 import json
 import os
+import threading
+import time
 from os.path import join
 
-from translate import GameTranslator
+from translate import (
+    GameTranslator, MultiTargetBuilder, get_file_depths, rank_pending)
 
 
 TEST_DIR = os.path.dirname(__file__)
@@ -20,3 +23,187 @@ def test_valid():
     t.call_translator = lambda text: text
     t.save_single_file = mock_save_single_file
     t.process_single_file('input.json')
+
+
+def test_multi_target(tmp_path):
+    profiles = [
+        {'game_dir': str(tmp_path / 'a'), 'line_limit': 60},
+        {'game_dir': str(tmp_path / 'b'), 'line_limit': 200},
+    ]
+    app = MultiTargetBuilder('src_game', profiles)
+    for t in app.translators:
+        t.from_path = TEST_DIR
+        t.to_path = t.dst_game_dir
+        os.makedirs(t.to_path)
+        t.call_translator = lambda text: text
+        t.fetch_dir = lambda: ['input.json']
+    app.run()
+    record = app.get_run_record()
+    assert record['bad_translate'] == len(app.translators[0].bad_translate) > 0
+    assert record['files'] == 1
+
+    for profile in profiles:
+        t = GameTranslator('src_game', 'src_game', profile['line_limit'])
+        t.from_path = TEST_DIR
+        t.call_translator = lambda text: text
+        got = {}
+        t.save_single_file = lambda filename, data: got.update(data)
+        t.process_single_file('input.json')
+        with open(join(profile['game_dir'], 'input.json')) as f:
+            assert json.load(f) == got
+
+
+def test_segment_sentences():
+    calls = []
+
+    def call_translator(text):
+        calls.append(text)
+        return text.upper()
+
+    t = GameTranslator('src_game', 'src_game', 300, segment_sentences=True)
+    t.call_translator = call_translator
+    got = t.translate_by_sentences('One line. Second\nline! Third?')
+    assert got == 'ONE LINE. SECOND LINE! THIRD?'
+    assert len(calls) == 3
+
+    calls.clear()
+    got = t.translate_by_sentences('One line. Changed\nline! Third?')
+    assert got == 'ONE LINE. CHANGED LINE! THIRD?'
+    assert calls == ['Changed line!']
+
+
+def test_run_pipeline(tmp_path):
+    t = GameTranslator('src_game', 'src_game', 60)
+    t.from_path = TEST_DIR
+    t.to_path = str(tmp_path)
+    t.call_translator = lambda text: text
+    t.fetch_dir = lambda: ['input.json', 'expected.json']
+    t.run()
+    assert sorted(os.listdir(tmp_path)) == ['expected.json', 'input.json']
+
+    for filename in t.fetch_dir():
+        t = GameTranslator('src_game', 'src_game', 60)
+        t.from_path = TEST_DIR
+        t.call_translator = lambda text: text
+        got = {}
+        t.save_single_file = lambda filename, data: got.update(data)
+        t.process_single_file(filename)
+        with open(join(tmp_path, filename)) as f:
+            assert json.load(f) == got
+
+
+def test_schedule_budget(tmp_path):
+    calls = []
+
+    def call_translator(text):
+        calls.append(text)
+        return 'ru ' + text
+
+    t = GameTranslator('src_game', 'src_game', 300)
+    t.from_path = TEST_DIR
+    t.translate_cache_filename = str(tmp_path / 'cache.json')
+    t.call_translator = call_translator
+    t.fetch_dir = lambda: ['input.json']
+    t.schedule(2, None)
+    assert len(calls) == 2
+    with open(t.translate_cache_filename) as f:
+        assert list(json.load(f)) == calls
+
+    got = {}
+    t.save_single_file = lambda filename, data: got.update(data)
+    t.process_single_file('input.json')
+    assert len(calls) == 2
+    assert t.translate_map.to_dict() == {text: 'ru ' + text for text in calls}
+
+
+def test_get_file_depths():
+    transfers = {
+        'System.json': set(),
+        'CommonEvents.json': {'Map005.json'},
+        'Map001.json': {'Map002.json'},
+        'Map002.json': {'Map003.json', 'Map001.json'},
+        'Map003.json': set(),
+        'Map004.json': set(),
+        'Map005.json': set(),
+    }
+    assert get_file_depths(list(transfers), transfers, 1) == {
+        'System.json': 0,
+        'CommonEvents.json': 0,
+        'Map001.json': 1,
+        'Map005.json': 1,
+        'Map002.json': 2,
+        'Map003.json': 3,
+        'Map004.json': 4,
+    }
+
+
+def test_rank_pending_shallowest_file():
+    depths = {'Map001.json': 5, 'Map002.json': 1, 'Map003.json': 2}
+    pending = {
+        'Deep': {'Map001.json'},
+        'Both': {'Map001.json', 'Map002.json'},
+        'Middle': {'Map003.json'},
+    }
+    counts = {'Deep': 1, 'Both': 1, 'Middle': 1}
+    assert rank_pending(pending, depths, counts.get) == ['Both', 'Middle', 'Deep']
+
+
+def test_schedule_time_budget(tmp_path):
+    threads = set()
+
+    def call_translator(text):
+        threads.add(threading.get_ident())
+        time.sleep(0.01)
+        return 'ru ' + text
+
+    t = GameTranslator('src_game', 'src_game', 300)
+    t.from_path = TEST_DIR
+    t.translate_cache_filename = str(tmp_path / 'cache.json')
+    t.call_translator = call_translator
+    t.fetch_dir = lambda: ['input.json']
+    t.schedule(None, 0)
+    assert not threads and not len(t.translate_map)
+
+    t.schedule(None, 60)
+    assert len(threads) > 1
+    assert len(t.translate_map) == t.stats['api_calls'] == 2
+
+
+def test_segment_sentences_seed_from_cached_block():
+    calls = []
+
+    def call_translator(text):
+        calls.append(text)
+        return text.upper()
+
+    t = GameTranslator('src_game', 'src_game', 300, segment_sentences=True)
+    t.call_translator = call_translator
+    t.translate_map['One. Two\nthree. Four?'] = 'Один. Два\nтри. Четыре?'
+    t.translate_map['Five. Six'] = 'Пять и шесть'
+    assert t.translate_by_sentences('One. Two\nthree. Four?') == 'Один. Два\nтри. Четыре?'
+    assert t.translate_by_sentences('Five. Six') == 'Пять и шесть'
+    assert 'Five.' not in t.translate_map
+    assert not calls
+
+    got = t.translate_by_sentences('One. Two three! Four?')
+    assert got == 'Один. TWO THREE! Четыре?'
+    assert calls == ['Two three!']
+    assert t.translate_map.uncounted() == []
+
+
+def test_segment_sentences_reseed_edited_block():
+    t = GameTranslator('src_game', 'src_game', 300, segment_sentences=True)
+    t.call_translator = str.upper
+    t.translate_map['One. Two. Three.'] = 'Один. Два. Три.'
+    assert t.translate_by_sentences('One. Two. Three.') == 'Один. Два. Три.'
+    assert t.translate_map['One.'] == 'Один.'
+
+    # the block is edited in the doc, then changed by a game update
+    t.translate_map['One. Two. Three.'] = 'Раз. Два. Три.'
+    assert t.translate_by_sentences('One. Two. Four.') == 'Раз. Два. FOUR.'
+
+    # a sentence translated on its own is not replaced by a block
+    t.translate_map['Five. Two. Three.'] = 'Пять! Двойка. Три.'
+    t.translate_by_sentences('Five. Two. Three.')
+    assert t.translate_map['Two.'] == 'Два.'
+    assert t.translate_map['Five.'] == 'Пять!'
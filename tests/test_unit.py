@@ -1,4 +1,28 @@
-from common import Font
+import json
+import os
+import pickle
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+import print_progress
+import update_from_doc
+from common import (
+    BackgroundWorker,
+    Font,
+    UMASK,
+    load_json,
+    merge_translations,
+    prefetch,
+    save_json_atomic,
+    split_sentences,
+    unescape_doc_text,
+    write_atomic,
+)
+from history import RunHistory, find_regressions, get_baseline
+from package import diff_manifests
+from settings import TRANSLATE_CACHE_BASE_FILENAME, TRANSLATE_CACHE_FILENAME
+from store import TranslateStore
 
 
 def test_split():
@@ -13,3 +37,212 @@ def test_split():
         'ситуациях. Удерживайте [SHIFT] выбирая орел или решку, чтобы',
         'увеличить свои шансы.',
     ]
+
+
+def test_merge_translations():
+    base = {'a': 'A', 'b': 'B', 'c': 'C', 'd': 'D'}
+    local = {'a': 'A', 'b': 'B local', 'c': 'C', 'd': 'D local', 'e': 'E'}
+    remote = iter([('a', 'A doc'), ('b', 'B'), ('f', 'F')])
+    merged, new_base, changed, conflicts = merge_translations(
+        base, local, remote)
+    assert merged == {
+        'a': 'A doc', 'b': 'B local', 'f': 'F', 'd': 'D local', 'e': 'E',
+    }
+    assert new_base == {'a': 'A doc', 'b': 'B', 'f': 'F'}
+    assert changed == {'a': 'A doc', 'f': 'F', 'c': None}
+    assert conflicts == {'d': ('D', 'D local', None)}
+
+
+def test_merge_translations_conflict():
+    merged, _, changed, conflicts = merge_translations(
+        {'a': 'A'}, {'a': 'A local'}, [('a', 'A doc')])
+    assert merged == {'a': 'A doc'}
+    assert changed == {'a': 'A doc'}
+    assert conflicts == {'a': ('A', 'A local', 'A doc')}
+
+
+def test_unescape_doc_text():
+    assert unescape_doc_text(r'one\ntwo \"q\" \\C[2]') == 'one\ntwo "q" \\C[2]'
+    assert unescape_doc_text(r'raw "quote"\n') == 'raw "quote"\n'
+
+
+def test_run_history_regressions(tmp_path):
+    history = RunHistory(str(tmp_path / 'history.sqlite3'))
+    for duration in (100, 110, 90):
+        history.append({'duration': duration, 'api_calls': 5}, {'Map001.json': 1.0})
+    history.append({'duration': 300, 'api_calls': 6}, {'Map001.json': 3.0})
+    latest, *previous = history.last_runs(4)
+    assert history.slowest_files(latest['id'], 1) == [('Map001.json', 3.0)]
+    history.close()
+    baseline = get_baseline(previous)
+    assert baseline['duration'] == 100
+    assert find_regressions(latest, baseline, 1.5) == [('duration', 300, 100)]
+
+
+def test_translate_store():
+    store = TranslateStore({'a': 'A', 'b': 'B', 'c': 'C'})
+    store.count('c')
+    store.count('a')
+    store.count('c')
+    assert store.get_count('c') == 2
+    assert store.uncounted() == ['b']
+    del store['b']
+    assert 'b' not in store and len(store) == 2
+    store['d'] = 'A'
+    assert store.to_dict() == {'a': 'A', 'c': 'C', 'd': 'A'}
+    store.resort()
+    assert store.to_dict() == {'c': 'C', 'a': 'A'}
+
+    other = TranslateStore({'x': 'X', 'a': 'A2'})
+    other.count('a')
+    store.merge(pickle.loads(pickle.dumps(other.snapshot())))
+    assert store.to_dict() == {'c': 'C', 'a': 'A2', 'x': 'X'}
+    assert store.get_count('a') == 2
+
+
+def test_translate_store_threads():
+    store = TranslateStore()
+    keys = [str(i) for i in range(1000)]
+
+    def work(_):
+        for key in keys:
+            store.count(key)
+            store[key] = key
+
+    with ThreadPool(10) as pool:
+        pool.map(work, range(10))
+    assert len(store) == len(keys)
+    assert sorted(store.counted()) == sorted(keys)
+    assert {store.get_count(key) for key in keys} == {10}
+
+
+def test_split_sentences():
+    head, sentences = split_sentences(
+        '\\>\\i[81]\\}Name\\{\\<\nWait\\. for it. Is it\n\\C[2]you\\C[0]? Yes!  ...')
+    assert head == '\\>\\i[81]\\}Name\\{\\<'
+    assert sentences == ['Wait\\. for it.', 'Is it \\C[2]you\\C[0]?', 'Yes!', '...']
+
+
+def test_prefetch_and_background_worker():
+    assert list(prefetch(lambda x: x * 2, range(5), 2)) == [
+        (0, 0), (1, 2), (2, 4), (3, 6), (4, 8)]
+
+    def fail(x):
+        raise ValueError(x)
+
+    with pytest.raises(ValueError):
+        list(prefetch(fail, [1], 2))
+
+    done = []
+    with pytest.raises(ValueError):
+        with BackgroundWorker(1) as worker:
+            worker.submit(done.append, 1)
+            worker.submit(fail, 2)
+    assert done == [1]
+
+
+def test_diff_manifests():
+    previous = {'files': {'a': '1', 'b': '2', 'c': '3'}}
+    current = {'files': {'a': '1', 'b': '22', 'd': '4'}}
+    assert diff_manifests(previous, current) == (['b', 'd'], ['c'])
+
+
+def test_progress(tmp_path, capsys):
+    original = tmp_path / 'original.json'
+    target = tmp_path / 'target.json'
+    snapshot = str(tmp_path / 'snapshot.json')
+    original.write_text(json.dumps({'a': 'Один', 'b': 'Два', 'c': 'Три'}))
+    target.write_text(json.dumps({'a': 'Один!', 'b': 'Двое'}))
+
+    print_progress.main(str(original), str(target), snapshot, None, True, True)
+    got = json.loads(capsys.readouterr().out)
+    assert got == {
+        'edited': 1,
+        'untouched': 1,
+        'missing': 1,
+        'percent': 50.0,
+        'weighted_percent': pytest.approx(100 * 3 / 7 / 2),
+    }
+
+    target.write_text(json.dumps({'a': 'Одна', 'b': 'Двое'}))
+    print_progress.main(str(original), str(target), snapshot, None, False, True)
+    assert json.loads(capsys.readouterr().out)['edited'] == 2
+
+
+def test_collect_keys():
+    data = [None, {'name': 'Name', 'list': [
+        {'code': 401, 'parameters': ['one']},
+        {'code': 401, 'parameters': ['two']},
+        {'code': 0, 'parameters': []},
+    ]}]
+    keys = {'Name', 'one\ntwo', 'other'}
+    assert print_progress.collect_keys(data, keys) == {'Name', 'one\ntwo'}
+
+
+def test_progress_files_key_set(tmp_path, capsys):
+    original = tmp_path / 'original.json'
+    target = tmp_path / 'target.json'
+    snapshot = str(tmp_path / 'snapshot.json')
+    data_dir = tmp_path / 'game' / 'www' / 'data'
+    data_dir.mkdir(parents=True)
+    (data_dir / 'MapInfos.json').write_text(json.dumps([None, {'id': 1, 'name': 'Town'}]))
+    (data_dir / 'Map001.json').write_text(json.dumps({'events': ['Hi', 'Bye']}))
+    original.write_text(json.dumps({'Hi': 'Привет'}))
+    target.write_text(json.dumps({'Hi': 'Здравствуй'}))
+    game_dir = str(tmp_path / 'game')
+
+    print_progress.main(str(original), str(target), snapshot, game_dir, False, True)
+    got = json.loads(capsys.readouterr().out)['files']
+    assert got['Map001.json'] == {'name': 'Town', 'edited': 1, 'total': 1}
+
+    original.write_text(json.dumps({'Hi': 'Привет', 'Bye': 'Пока'}))
+    target.write_text(json.dumps({'Hi': 'Здравствуй', 'Bye': 'Пока'}))
+    print_progress.main(str(original), str(target), snapshot, game_dir, False, True)
+    got = json.loads(capsys.readouterr().out)['files']
+    assert got['Map001.json'] == {'name': 'Town', 'edited': 1, 'total': 2}
+
+
+def test_write_atomic_mode(tmp_path):
+    path = tmp_path / 'new.json'
+    write_atomic(str(path), '{}')
+    assert path.stat().st_mode & 0o777 == 0o666 & ~UMASK
+
+    path.chmod(0o640)
+    write_atomic(str(path), '[]')
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert path.read_text() == '[]'
+
+
+def test_write_atomic_error(tmp_path, monkeypatch):
+    def chmod(path, mode):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(os, 'chmod', chmod)
+    fds = len(os.listdir('/proc/self/fd'))
+    with pytest.raises(PermissionError):
+        write_atomic(str(tmp_path / 'new.json'), '{}')
+    assert len(os.listdir('/proc/self/fd')) == fds
+    assert os.listdir(tmp_path) == []
+
+
+def test_update_from_doc_without_snapshot(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(update_from_doc, 'get_authenticated_service', lambda: None)
+    monkeypatch.setattr(
+        update_from_doc,
+        'get_parts',
+        lambda service: iter([('a', 'A doc'), ('b', 'B'), ('n', 'N\\nline')]),
+    )
+    save_json_atomic(
+        TRANSLATE_CACHE_FILENAME, {'a': 'A local', 'b': 'B', 'local': 'L'})
+
+    update_from_doc.main(None)
+    assert load_json(TRANSLATE_CACHE_FILENAME) == {
+        'a': 'A doc', 'b': 'B', 'n': 'N\nline', 'local': 'L',
+    }
+    assert load_json(TRANSLATE_CACHE_BASE_FILENAME) == {
+        'a': 'A doc', 'b': 'B', 'n': 'N\nline',
+    }
+    captured = capsys.readouterr()
+    assert captured.out.split('\n') == ['~ "a"', '~ "n"', '']
+    assert 'Conflict: "a"' in captured.err
@@ -2,8 +2,12 @@
 import argparse
 import json
 import logging
+import marshal
 import os
 import shutil
+import threading
+import time
+import zlib
 from collections import defaultdict
 from functools import partial
 from multiprocessing.pool import ThreadPool
@@ -12,47 +16,157 @@ from os.path import join
 from translatepy.translators.yandex import YandexTranslate
 
 from common import (
-    Font,
+    BackgroundWorker,
     combine_desc_and_note,
     iterate_over_dict,
-    collapse,
+    collapse_data,
     except_gab_text,
     fix_name,
+    load_font,
+    load_json,
+    prefetch,
     FMT_REGEX,
     ASCII_REGEX,
     replace_escapes,
+    save_json_atomic,
+    split_sentences,
     translate_category,
+    write_atomic,
 )
-from settings import TRANSLATE_CACHE_FILENAME
+from history import RunHistory, get_peak_memory
+from store import TranslateStore
+from settings import (
+    CHECKPOINT_EVERY,
+    DEFAULT_FONT,
+    PIPELINE_DEPTH,
+    RUN_HISTORY_FILENAME,
+    SOURCE_LANGUAGE,
+    TARGET_LANGUAGE,
+    TRANSLATE_CACHE_FILENAME,
+    TRANSLATOR_THREADS,
+)
+
+
+def get_cache_filename(language: str) -> str:
+    if language == TARGET_LANGUAGE:
+        return TRANSLATE_CACHE_FILENAME
+    name, ext = os.path.splitext(TRANSLATE_CACHE_FILENAME)
+    return f'{name}.{language}{ext}'
+
+
+def get_seeds_filename(cache_filename: str) -> str:
+    name, ext = os.path.splitext(cache_filename)
+    return f'{name}.seeds{ext}'
+
+
+def get_map_filename(map_id: int) -> str:
+    return f'Map{map_id:03d}.json'
+
+
+def get_file_depths(
+        filenames: list[str],
+        transfers: dict[str, set[str]],
+        start_map: int | None,
+) -> dict[str, int]:
+    """
+    Depth of every file in the transfer graph: database files and common
+    events are 0, the start map and maps reachable from common events are 1,
+    unreachable maps go last.
+    """
+    depths = {fn: 0 for fn in filenames if not fn.startswith('Map')}
+    front = set()
+    if start_map is not None:
+        front.add(get_map_filename(start_map))
+    for fn in depths:
+        front |= transfers.get(fn, set())
+    depth = 1
+    while front:
+        front = {fn for fn in front if fn in transfers and fn not in depths}
+        for fn in front:
+            depths[fn] = depth
+        front = set().union(*(transfers[fn] for fn in front))
+        depth += 1
+    for fn in filenames:
+        depths.setdefault(fn, depth)
+    return depths
+
+
+def rank_pending(
+        pending: dict[str, set[str]],
+        depths: dict[str, int],
+        get_count,
+) -> list[str]:
+    """
+    Orders strings by count / (1 + depth of the shallowest file where
+    they appear): frequent strings and early maps go first.
+    """
+    order = {text: n for n, text in enumerate(pending)}
+    depth = {
+        text: min(depths.get(fn, 0) for fn in filenames)
+        for text, filenames in pending.items()
+    }
+    return sorted(
+        pending,
+        key=lambda text: (
+            -get_count(text) / (1 + depth[text]),
+            order[text],
+        ),
+    )
 
 
 class GameTranslator:
 
-    def __init__(self, src_game_dir: str, dst_game_dir: str, line_limit: int):
+    def __init__(
+            self,
+            src_game_dir: str,
+            dst_game_dir: str,
+            line_limit: int,
+            font_path: str = DEFAULT_FONT,
+            language: str = TARGET_LANGUAGE,
+            segment_sentences: bool = False,
+    ):
         self.src_game_dir = src_game_dir
         self.dst_game_dir = dst_game_dir
+        self.from_path = join(src_game_dir, 'www/data')
         self.to_path = join(dst_game_dir, 'www/data')
-        self.translate_map = {}
-        self.translate_map_counter = defaultdict(int)
+        self.translate_map = TranslateStore()
         self.translator = YandexTranslate()
         self.line_limit = line_limit
+        self.language = language
+        self.segment_sentences = segment_sentences
+        self.translate_cache_filename = get_cache_filename(language)
+        self.seeds_filename = get_seeds_filename(self.translate_cache_filename)
+        # sentence -> [block it was seeded from, crc of the block translation]
+        self.seeds = {}
+        # diagnostics are keyed by ids of self.translate_map keys
         self.bad_formatting = {}
         self.bad_translate = {}
-        self.font = Font(
-            join(src_game_dir, 'www/fonts/Garamond-Premier-Pro_19595.ttf'))
+        self.font = load_font(join(src_game_dir, font_path))
         self.overspaces = {}
+        self.stats = defaultdict(int)
+        self.stats_lock = threading.Lock()
+        self.file_timings = {}
+        # with a budget the strings missing in the cache are left as is
+        self.defer_misses = False
+        self.pending = {}  # string -> files where it was found
+        self.current_filename = None
 
     def run(self):
         filenames = self.fetch_dir()
         filenames = self.sort_files(filenames)
-        for n, filename in enumerate(filenames, start=1):
-            print(f'{n}/{len(filenames)} {filename} .. ')
-            self.process_single_file(filename)
+        files = prefetch(self.load_single_file, filenames, PIPELINE_DEPTH)
+        with BackgroundWorker(PIPELINE_DEPTH) as writer:
+            for n, (filename, data) in enumerate(files, start=1):
+                print(f'{n}/{len(filenames)} {filename} .. ')
+                start = time.perf_counter()
+                self.translate_data(filename, data, collapse_data(data))
+                writer.submit(self.save_single_file, filename, data)
+                self.file_timings[filename] = time.perf_counter() - start
 
     def fetch_dir(self) -> list[str]:
         return [
             filename
-            for filename in os.listdir(self.to_path)
+            for filename in os.listdir(self.from_path)
             if os.path.splitext(filename)[1].lower() == '.json'
         ]
 
@@ -75,16 +189,103 @@ class GameTranslator:
         return up + middle + down
 
     def process_single_file(self, filename: str):
-        from_path = os.path.join(self.to_path, filename)
-        data = json.loads(open(from_path).read())
-        with ThreadPool(10) as pool:
-            pool.map(
-                partial(self.task, filename),
-                collapse(iterate_over_dict(data)),
-            )
+        data = self.load_single_file(filename)
+        self.translate_data(filename, data, collapse_data(data))
+        self.save_single_file(filename, data)
+
+    def load_single_file(self, filename: str) -> dict | list:
+        from_path = os.path.join(self.from_path, filename)
+        with open(from_path) as f:
+            return json.loads(f.read())
+
+    def translate_data(self, filename: str, data: dict | list, objs: list[dict]):
+        self.translate_objects(filename, objs)
         for obj in iterate_over_dict(data):
             self.wrap_lines(obj)
-        self.save_single_file(filename, data)
+
+    def translate_objects(self, filename: str, objs: list[dict]):
+        self.current_filename = filename
+        with ThreadPool(TRANSLATOR_THREADS) as pool:
+            pool.map(partial(self.task, filename), objs)
+
+    def schedule(self, max_api_calls: int | None, time_budget: float | None):
+        """
+        Translates the strings missing in the cache in order of
+        visibility until the budget is spent, the rest stay untranslated
+        in this run. The strings are translated by batches of
+        CHECKPOINT_EVERY in a thread pool, the budget is checked and
+        the cache is saved after every batch, so the next run continues
+        with what is left. Costs an extra walk over the game before run().
+        """
+        self.defer_misses = True
+        depths = self.collect_pending()
+        queue = rank_pending(
+            self.pending,
+            depths,
+            self.translate_map.get_count,
+        )
+        print(f'{len(queue)} strings are missing in the cache')
+        started_at = time.perf_counter()
+        done = 0
+        with ThreadPool(TRANSLATOR_THREADS) as pool:
+            while done < len(queue):
+                if max_api_calls is not None and done >= max_api_calls:
+                    break
+                if (
+                        time_budget is not None and
+                        time.perf_counter() - started_at >= time_budget
+                ):
+                    break
+                size = CHECKPOINT_EVERY
+                if max_api_calls is not None:
+                    size = min(size, max_api_calls - done)
+                batch = queue[done:done + size]
+                pool.map(self.fetch_translation, batch)
+                done += len(batch)
+                self.save_translate_cache()
+        print(f'translated {done}, left {len(queue) - done}')
+        self.pending = {}
+
+    def collect_pending(self) -> dict[str, int]:
+        """
+        Walks the game without the translator, collecting the strings
+        missing in the cache, and returns the depth of every file
+        in the map transfer graph from the start map.
+        """
+        filenames = self.sort_files(self.fetch_dir())
+        start_map = None
+        transfers = {}
+        files = prefetch(self.load_single_file, filenames, PIPELINE_DEPTH)
+        for filename, data in files:
+            objs = collapse_data(data)
+            self.translate_objects(filename, objs)
+            if filename == 'System.json':
+                start_map = data.get('startMapId')
+            transfers[filename] = {
+                get_map_filename(obj['parameters'][1])
+                for obj in objs
+                if obj.get('code') == 201 and obj['parameters'][0] == 0
+            }
+        # do not count the same strings twice in the run history
+        self.stats['strings'] = 0
+        self.stats['cache_hits'] = 0
+        self.bad_formatting = {}
+        self.bad_translate = {}
+        self.overspaces = {}
+        return get_file_depths(filenames, transfers, start_map)
+
+    def add_stat(self, name: str, value: float = 1):
+        with self.stats_lock:
+            self.stats[name] += value
+
+    def fetch_translation(self, orig_text: str) -> str:
+        text = fix_name(orig_text)
+        start = time.perf_counter()
+        translated = replace_escapes(self.call_translator)(text)
+        self.add_stat('translator_time', time.perf_counter() - start)
+        self.add_stat('api_calls')
+        self.translate_map[orig_text] = translated
+        return translated
 
     def wrap_lines(self, obj: dict):
         items = obj.get('list')
@@ -112,8 +313,7 @@ class GameTranslator:
 
     def save_single_file(self, filename: str, data: dict):
         to_path = os.path.join(self.to_path, filename)
-        with open(to_path, 'w') as f:
-            f.write(json.dumps(data, ensure_ascii=False))
+        write_atomic(to_path, json.dumps(data, ensure_ascii=False))
 
     def task(self, filename: str, obj: dict):
         match filename:
@@ -190,7 +390,11 @@ class GameTranslator:
             case 401:
                 assert len(obj['parameters']) == 1
                 obj['parameters'] = [
-                    self.split_and_translate_text(obj['parameters'][0], 4)
+                    self.split_and_translate_text(
+                        obj['parameters'][0],
+                        4,
+                        self.segment_sentences,
+                    )
                 ]
             case 320:
                 assert len(obj['parameters']) == 2
@@ -207,15 +411,17 @@ class GameTranslator:
 
         orig_text = text
 
-        self.translate_map_counter[orig_text] += 1
+        self.translate_map.count(orig_text)
+        self.add_stat('strings')
 
         if orig_text in self.translate_map:
             translated = self.translate_map[orig_text]
+            self.add_stat('cache_hits')
+        elif self.defer_misses:
+            self.pending.setdefault(orig_text, set()).add(self.current_filename)
+            return orig_text
         else:
-            text = fix_name(text)
-            translated = replace_escapes(self.call_translator)(text)
-
-        self.translate_map[orig_text] = translated
+            translated = self.fetch_translation(orig_text)
 
         self.check_bad_translate(orig_text, translated)
         self.check_format_after_translate(orig_text, translated)
@@ -224,11 +430,86 @@ class GameTranslator:
             logging.info('%s > %s', orig_text, translated)
         return translated
 
+    def translate_by_sentences(self, text: str) -> str:
+        """
+        Translates a message block sentence by sentence, so a changed
+        sentence does not send the whole block to the translator again.
+        A block which is already in the cache is used as is and seeds
+        the cache of its sentences.
+        """
+        if not isinstance(text, str):
+            return text
+        if text in self.translate_map:
+            translated = self.translate(text)
+            self.seed_sentences(text, translated)
+            return translated
+        head, sentences = split_sentences(text)
+        if len(sentences) < 2:
+            return self.translate(text)
+        for sentence in (sentences + [head] if head else sentences):
+            self.refresh_seed(sentence)
+        translated = ' '.join(self.translate(s) for s in sentences)
+        if head:
+            translated = self.translate(head) + '\n' + translated
+        return translated
+
+    def seed_sentences(self, text: str, translated: str) -> bool:
+        """
+        Caches the sentences of a cached block, when the block and its
+        translation split into the same number of sentences.
+        Sentences which are already in the cache are replaced only when
+        they were seeded from this block and its translation has changed.
+        """
+        head, sentences = split_sentences(text)
+        t_head, t_sentences = split_sentences(translated)
+        if (
+                len(sentences) < 2 or
+                len(sentences) != len(t_sentences) or
+                bool(head) != bool(t_head)
+        ):
+            return False
+        pairs = list(zip(sentences, t_sentences))
+        if head:
+            pairs.append((head, t_head))
+        crc = zlib.crc32(translated.encode('utf-8'))
+        for sentence, t_sentence in pairs:
+            # counted, so clean_bad_cache keeps them
+            self.translate_map.count(sentence)
+            seed = self.seeds.get(sentence)
+            if seed is not None and seed[0] == text:
+                if seed[1] == crc:
+                    continue
+            elif sentence in self.translate_map:
+                continue
+            self.translate_map[sentence] = t_sentence
+            self.seeds[sentence] = [text, crc]
+        return True
+
+    def refresh_seed(self, sentence: str):
+        """
+        Updates a seeded sentence when the translation of its block
+        was edited after seeding, e.g. in the doc.
+        """
+        seed = self.seeds.get(sentence)
+        if seed is None:
+            return
+        block, crc = seed
+        translated = self.translate_map.get(block)
+        if translated is None:
+            # the block is gone, the sentence is an ordinary entry now
+            del self.seeds[sentence]
+        elif zlib.crc32(translated.encode('utf-8')) != crc:
+            if not self.seed_sentences(block, translated):
+                # the edited block does not split the same way
+                del self.seeds[sentence]
+                if sentence in self.translate_map:
+                    del self.translate_map[sentence]
+
     def mark_translate(self, text) -> str:
         if not isinstance(text, str) or not text.strip():
             return text
 
-        self.translate_map_counter[text] += 1
+        self.translate_map.count(text)
 
         if text in self.translate_map:
             return self.translate_map[text]
@@ -238,27 +519,35 @@ class GameTranslator:
     def call_translator(self, text: str) -> str:
         return self.translator.translate(
             text,
-            source_language='en',
-            destination_language='ru',
+            source_language=SOURCE_LANGUAGE,
+            destination_language=self.language,
         ).result
 
     def split_and_translate_text(
             self,
             text: str,
             count_lines: int,
+            segment: bool = False,
     ) -> str:
-        translated = self.translate(text)
+        if segment:
+            translated = self.translate_by_sentences(text)
+        else:
+            translated = self.translate(text)
         parts = self.font.split_text(translated, self.line_limit, count_lines)
         result = '\n'.join(parts)
         if len(parts) > count_lines:
-            self.overspaces[text] = count_lines, len(parts), result
+            self.overspaces[self.translate_map.intern(text)] = (
+                count_lines,
+                len(parts),
+                result,
+            )
         return result
 
     def check_format_after_translate(self, text: str, translated: str):
         a = FMT_REGEX.findall(text)
         b = FMT_REGEX.findall(translated)
         if a != b:
-            self.bad_formatting[text] = translated
+            self.bad_formatting[self.translate_map.intern(text)] = translated
 
     def check_bad_translate(self, text: str, translated: str):
         orig_translated = translated
@@ -267,7 +556,8 @@ class GameTranslator:
             translated = translated[:start] + translated[stop:]
         m = ASCII_REGEX.search(translated)
         if m:
-            self.bad_translate[text] = orig_translated
+            self.bad_translate[self.translate_map.intern(text)] = (
+                orig_translated)
 
     def copy_to_game_dir(self):
         if self.src_game_dir != self.dst_game_dir:
@@ -275,25 +565,30 @@ class GameTranslator:
                 self.src_game_dir, self.dst_game_dir, dirs_exist_ok=True)
 
     def load_translate_cache(self):
-        if os.path.exists(TRANSLATE_CACHE_FILENAME):
-            print('load translate cache from', TRANSLATE_CACHE_FILENAME)
-            with open(TRANSLATE_CACHE_FILENAME, 'r') as f:
-                self.translate_map = json.load(f)
+        if os.path.exists(self.translate_cache_filename):
+            print('load translate cache from', self.translate_cache_filename)
+            with open(self.translate_cache_filename, 'r') as f:
+                self.translate_map.update(json.load(f))
+        self.seeds = load_json(self.seeds_filename, {})
 
     def resort_translate_cache(self):
-        new_map = {}
-        for k in self.translate_map_counter.keys():
-            new_map[k] = self.translate_map[k]
-        self.translate_map = new_map
+        self.translate_map.resort()
 
     def save_translate_cache(self):
-        print('save translate cache to', TRANSLATE_CACHE_FILENAME)
-        with open(TRANSLATE_CACHE_FILENAME, 'w') as f:
-            json.dump(self.translate_map, f, ensure_ascii=False, indent=2)
+        print('save translate cache to', self.translate_cache_filename)
+        save_json_atomic(
+            self.translate_cache_filename,
+            self.translate_map.to_dict(),
+            ensure_ascii=False,
+            indent=2,
+        )
+        seeds = {k: v for k, v in self.seeds.items() if k in self.translate_map}
+        if seeds or os.path.exists(self.seeds_filename):
+            save_json_atomic(self.seeds_filename, seeds, ensure_ascii=False)
 
     def clean_bad_cache(self):
         was_deleted = {}
-        for key in set(self.translate_map) - set(self.translate_map_counter):
+        for key in self.translate_map.uncounted():
             was_deleted[key] = self.translate_map[key]
             del self.translate_map[key]
         if was_deleted:
@@ -301,13 +596,23 @@ class GameTranslator:
             for k, v in was_deleted.items():
                 print(repr(k), '>', repr(v))
 
+    def get_run_record(self) -> dict:
+        return {
+            **self.stats,
+            'files': len(self.file_timings),
+            'overspaces': len(self.overspaces),
+            'bad_translate': len(self.bad_translate),
+            'bad_formatting': len(self.bad_formatting),
+        }
+
     def print_bad_format(self):
         if not self.bad_formatting:
             return
         print('=== Bad formatting strings:')
+        keys = self.translate_map.keys_by_id
         for text, translated in self.bad_formatting.items():
             print(
-                json.dumps(text, ensure_ascii=False),
+                json.dumps(keys[text], ensure_ascii=False),
                 '>',
                 json.dumps(translated, ensure_ascii=False),
             )
@@ -320,10 +625,11 @@ class GameTranslator:
         print()
         print('=== Over space strings ===')
         print()
+        keys = self.translate_map.keys_by_id
         for text, (need_ln, ln, translated) in self.overspaces.items():
             print(
                 f'[{need_ln}]',
-                json.dumps(text, ensure_ascii=False),
+                json.dumps(keys[text], ensure_ascii=False),
             )
             print(
                 f'[{ln}]',
@@ -337,9 +643,10 @@ class GameTranslator:
         if not self.bad_translate:
             return
         print('=== Bad translate strings:')
+        keys = self.translate_map.keys_by_id
         for text, translated in self.bad_translate.items():
             print(
-                json.dumps(text, ensure_ascii=False),
+                json.dumps(keys[text], ensure_ascii=False),
                 '>',
                 json.dumps(translated, ensure_ascii=False),
             )
@@ -347,19 +654,144 @@ class GameTranslator:
         print()
 
 
+class MultiTargetBuilder:
+    """
+    Builds several targets (line limit, font, language, output dir)
+    from one parse: each source file is read and collapsed once, then
+    every target translates and writes its own copy.
+    Targets with the same language share the translate cache.
+    """
+
+    def __init__(
+            self,
+            src_game_dir: str,
+            profiles: list[dict],
+            segment_sentences: bool = False,
+    ):
+        self.translators = [
+            GameTranslator(
+                src_game_dir,
+                profile['game_dir'],
+                profile['line_limit'],
+                profile.get('font', DEFAULT_FONT),
+                profile.get('language', TARGET_LANGUAGE),
+                segment_sentences,
+            )
+            for profile in profiles
+        ]
+        self.primary = {}
+        for t in self.translators:
+            self.primary.setdefault(t.language, t)
+        self.file_timings = {}
+
+    def copy_to_game_dir(self):
+        for t in self.translators:
+            t.copy_to_game_dir()
+
+    def schedule(self, max_api_calls: int | None, time_budget: float | None):
+        for t in self.primary.values():
+            t.schedule(max_api_calls, time_budget)
+        for t in self.translators:
+            t.defer_misses = True
+
+    def load_translate_cache(self):
+        for t in self.primary.values():
+            t.load_translate_cache()
+        for t in self.translators:
+            primary = self.primary[t.language]
+            t.translate_map = primary.translate_map
+            t.seeds = primary.seeds
+
+    def run(self):
+        first = self.translators[0]
+        filenames = first.sort_files(first.fetch_dir())
+        files = prefetch(first.load_single_file, filenames, PIPELINE_DEPTH)
+        with BackgroundWorker(PIPELINE_DEPTH) as writer:
+            for n, (filename, data) in enumerate(files, start=1):
+                print(f'{n}/{len(filenames)} {filename} .. ')
+                start = time.perf_counter()
+                collapse_data(data)
+                blob = marshal.dumps(data)
+                for t in self.translators:
+                    data = marshal.loads(blob)
+                    t.translate_data(
+                        filename, data, list(iterate_over_dict(data)))
+                    writer.submit(t.save_single_file, filename, data)
+                self.file_timings[filename] = time.perf_counter() - start
+
+    def clean_bad_cache(self):
+        for t in self.primary.values():
+            t.clean_bad_cache()
+
+    def resort_translate_cache(self):
+        for t in self.primary.values():
+            t.resort_translate_cache()
+
+    def save_translate_cache(self):
+        for t in self.primary.values():
+            t.save_translate_cache()
+
+    def get_run_record(self) -> dict:
+        record = defaultdict(int)
+        for t in self.translators:
+            for k, v in t.stats.items():
+                record[k] += v
+        # the diagnostics of same language targets repeat each other
+        for t in self.primary.values():
+            record['overspaces'] += len(t.overspaces)
+            record['bad_translate'] += len(t.bad_translate)
+            record['bad_formatting'] += len(t.bad_formatting)
+        record['files'] = len(self.file_timings)
+        return record
+
+    def print_bad_format(self):
+        for t in self.primary.values():
+            t.print_bad_format()
+
+    def print_overspaces(self):
+        for t in self.translators:
+            print('===', t.dst_game_dir)
+            t.print_overspaces()
+
+    def print_bad_translate(self):
+        for t in self.primary.values():
+            t.print_bad_translate()
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument(
         '--game-dir',
         help='location of game directory',
-        required=True,
     )
     parser.add_argument(
         '--line-limit',
         help='the number of characters in the line after which'
              ' the sentence will be wrapped to a new line',
         type=int,
-        required=True,
+    )
+    parser.add_argument(
+        '--profiles',
+        help='json file with a list of targets to build from one parse:'
+             ' [{"game_dir": ..., "line_limit": ..., "font": ...,'
+             ' "language": ...}], font and language are optional',
+    )
+    parser.add_argument(
+        '--segment-sentences',
+        help='cache multi-line messages by sentence, so a changed sentence'
+             ' does not send the whole message to the translator',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--max-api-calls',
+        help='translate at most this number of new strings, the most'
+             ' visible first, the rest stay untranslated until the next run',
+        type=int,
+    )
+    parser.add_argument(
+        '--time-budget',
+        help='the same as --max-api-calls, but limited by seconds',
+        type=float,
     )
     parser.add_argument(
         '--resort-cache',
@@ -381,7 +813,16 @@ if __name__ == '__main__':
         '--log',
         action='store_true',
     )
+    parser.add_argument(
+        '--no-history',
+        help=f'do not append the run metrics to {RUN_HISTORY_FILENAME}',
+        action='store_true',
+    )
     args = parser.parse_args()
+    if args.profiles is None and (
+            args.game_dir is None or args.line_limit is None):
+        parser.error('--game-dir and --line-limit or --profiles are required')
+    started_at = time.time()
     try:
         if args.log:
             logging.basicConfig(
@@ -390,20 +831,32 @@ if __name__ == '__main__':
                 level=logging.ERROR,
             )
         logging.info('start')
-        app = GameTranslator(
-            'src_game',
-            args.game_dir,
-            args.line_limit,
-        )
+        if args.profiles:
+            with open(args.profiles) as f:
+                app = MultiTargetBuilder(
+                    'src_game',
+                    json.load(f),
+                    segment_sentences=args.segment_sentences,
+                )
+        else:
+            app = GameTranslator(
+                'src_game',
+                args.game_dir,
+                args.line_limit,
+                segment_sentences=args.segment_sentences,
+            )
         app.copy_to_game_dir()
         app.load_translate_cache()
     except KeyboardInterrupt:
         pass
     else:
+        status = 'ok'
         try:
+            if args.max_api_calls is not None or args.time_budget is not None:
+                app.schedule(args.max_api_calls, args.time_budget)
             app.run()
         except KeyboardInterrupt:
-            pass
+            status = 'interrupted'
         else:
             app.clean_bad_cache()
         if args.resort_cache:
@@ -415,3 +868,10 @@ if __name__ == '__main__':
             app.print_overspaces()
         if args.print_bad_translate:
             app.print_bad_translate()
+        if not args.no_history:
+            record = app.get_run_record()
+            record['duration'] = time.time() - started_at
+            record['peak_memory'] = get_peak_memory()
+            history = RunHistory()
+            history.append(record, app.file_timings, status, started_at)
+            history.close()
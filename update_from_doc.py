@@ -1,15 +1,65 @@
 #!/usr/bin/env python3
-from common import get_authenticated_service, get_parts
+import argparse
+import json
+import sys
 
+from common import (
+    get_authenticated_service,
+    get_parts,
+    load_json,
+    merge_translations,
+    save_json_atomic,
+    unescape_doc_text,
+)
+from settings import TRANSLATE_CACHE_BASE_FILENAME, TRANSLATE_CACHE_FILENAME
 
-if __name__ == '__main__':
+
+def iterate_doc_pairs(service):
+    for text, translated in get_parts(service):
+        yield unescape_doc_text(text), unescape_doc_text(translated)
+
+
+def main(changed_keys_path: str | None):
+    local = load_json(TRANSLATE_CACHE_FILENAME, {})
+    # without a snapshot of the previous sync local-only keys are kept
+    # and keys which differ from the doc are reported as conflicts
+    base = load_json(TRANSLATE_CACHE_BASE_FILENAME, {})
     service = get_authenticated_service()
-    itr = get_parts(service)
-    print('{')
-    text, translated = next(itr)
-    print(f'  "{text}": "{translated}"', end='')
-    for text, translated in itr:
-        print(',')
-        print(f'  "{text}": "{translated}"', end='')
-    print()
-    print('}', end='')
+    merged, new_base, changed, conflicts = merge_translations(
+        base,
+        local,
+        iterate_doc_pairs(service),
+    )
+    save_json_atomic(
+        TRANSLATE_CACHE_FILENAME, merged, ensure_ascii=False, indent=2)
+    save_json_atomic(
+        TRANSLATE_CACHE_BASE_FILENAME, new_base, ensure_ascii=False, indent=2)
+
+    for key, value in changed.items():
+        print(
+            '-' if value is None else '~',
+            json.dumps(key, ensure_ascii=False),
+        )
+    for key, (ancestor, ours, theirs) in conflicts.items():
+        print('=== Conflict:', json.dumps(key, ensure_ascii=False), file=sys.stderr)
+        print('base  ', json.dumps(ancestor, ensure_ascii=False), file=sys.stderr)
+        print('local ', json.dumps(ours, ensure_ascii=False), file=sys.stderr)
+        print('doc   ', json.dumps(theirs, ensure_ascii=False), file=sys.stderr)
+    print(
+        f'changed: {len(changed)}, conflicts: {len(conflicts)},'
+        f' total: {len(merged)}',
+        file=sys.stderr,
+    )
+    if changed_keys_path:
+        save_json_atomic(
+            changed_keys_path, list(changed), ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--changed-keys',
+        help='write the list of changed keys to this file',
+    )
+    args = parser.parse_args()
+    main(args.changed_keys)